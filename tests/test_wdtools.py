@@ -2,6 +2,7 @@ import sys
 sys.path.append('../wdtools/')
 import wdtools
 import numpy as np
+import pytest
 
 def test_gfp():
 
@@ -33,5 +34,156 @@ def test_gfp():
 			assert labels[0] < teff + 1000 and labels[0] > teff - 1000
 			assert labels[1] < logg + 0.25 and labels[1] > logg - 0.25
 
+def test_fast_norm():
+
+	gfp = wdtools.GFP(resolution = 1)
+	wl = np.linspace(3800, 7000, 7000 - 3800)
+	rng = np.random.default_rng(0)
+
+	for teff, logg in [(9000, 8), (15000, 7.5), (30000, 8.5)]:
+		fl = gfp.spectrum_sampler(wl, teff, logg)
+		sigma = fl / 100
+		fl = fl + sigma * rng.normal(size = len(fl))
+		kw = dict(mcmc = False, lines = ['beta', 'gamma', 'delta', 'eps', 'h8'], make_plot = False, verbose = False)
+
+		exact, _, _ = gfp.fit_spectrum(wl, fl, 1 / sigma**2, **kw)
+		fast, _, _ = gfp.fit_spectrum(wl, fl, 1 / sigma**2, fast_norm = True, **kw)
+
+		# the fixed-knot continuum projection is an approximation, but it should only move the labels slightly
+		assert abs(fast[0] - exact[0]) < 150
+		assert abs(fast[1] - exact[1]) < 0.03
+
+def test_fit_init_de():
+
+	gfp = wdtools.GFP(resolution = 1)
+	wl = np.linspace(3800, 7000, 7000 - 3800)
+	rng = np.random.default_rng(1)
+
+	for teff, logg in [(9000, 8), (20000, 7.5)]:
+		fl = gfp.spectrum_sampler(wl, teff, logg)
+		sigma = fl / 100
+		fl = fl + sigma * rng.normal(size = len(fl))
+
+		labels, _, _ = gfp.fit_spectrum(wl, fl, 1 / sigma**2, mcmc = False, lines = ['beta', 'gamma', 'delta', 'eps', 'h8'], make_plot = False, 
+										verbose = False, init = 'de', de_kw = dict(popsize = 20, tol = 1e-3, seed = 0))
+
+		assert labels[0] < teff + 1000 and labels[0] > teff - 1000
+		assert labels[1] < logg + 0.25 and labels[1] > logg - 0.25
+
+	with pytest.raises(ValueError):
+		gfp.fit_spectrum(wl, fl, 1 / sigma**2, make_plot = False, verbose = False, init = 'differential_evolution')
+
+def test_fit_init_grid():
+
+	gfp = wdtools.GFP(resolution = 1)
+	wl = np.linspace(3800, 7000, 7000 - 3800)
+	rng = np.random.default_rng(2)
+
+	for teff, logg in [(9000, 8), (9000, 7.25), (20000, 7.5)]:
+		fl = gfp.spectrum_sampler(wl, teff, logg)
+		sigma = fl / 100
+		fl = fl + sigma * rng.normal(size = len(fl))
+
+		labels, _, _ = gfp.fit_spectrum(wl, fl, 1 / sigma**2, mcmc = False, lines = ['beta', 'gamma', 'delta', 'eps', 'h8'], make_plot = False, 
+										verbose = False, init = 'grid')
+
+		assert labels[0] < teff + 1000 and labels[0] > teff - 1000
+		assert labels[1] < logg + 0.25 and labels[1] > logg - 0.25
+
+def test_spectrum_sampler_batch():
+
+	gfp = wdtools.GFP(resolution = 1)
+	wl = np.linspace(3800, 7000, 7000 - 3800)
+
+	params = np.array([[8000, 7.5], [15000, 8.0], [30000, 8.5]])
+	batch = gfp.spectrum_sampler_batch(wl, params)
+
+	assert batch.shape == (len(params), len(wl))
+
+	for ii in range(len(params)):
+		assert np.allclose(batch[ii], gfp.spectrum_sampler(wl, *params[ii]), rtol = 1e-4)
+
+	# array-valued labels, e.g. from a posterior sample, are accepted as well
+	assert np.array_equal(gfp.spectrum_sampler(wl, np.array(15000.), np.array([8.0])), gfp.spectrum_sampler(wl, 15000., 8.0))
+
+def test_remap_operator():
+
+	gfp = wdtools.GFP(resolution = 1)
+	lamgrid = gfp.lamgrid['DA']
+	params = np.array([[8000, 7.5], [15000, 8.0], [30000, 8.5]])
+	native = gfp._nn_forward(params, 'DA')
+
+	gfp.rv_fixed = True
+	# the full grid reaches both edges, where the kernel is mirrored, and the narrow grid only needs a window of native pixels
+	for wl, rv in [(np.linspace(lamgrid[0], lamgrid[-1], 3000), -50), (np.linspace(lamgrid[0], lamgrid[-1], 3000), 50), (np.linspace(4000, 5000, 1000), 50)]:
+		gfp.rv = rv
+		gfp.specialize_for_wl(wl)
+		assert gfp._get_remap(wl, rv, 'DA') is not None
+
+		reference = gfp._resample(wl, gfp._convolve(native, 'DA'), 'DA', rv)
+		assert np.allclose(gfp.spectrum_sampler_batch(wl, params), reference, rtol = 1e-4, equal_nan = True)
+		for ii in range(len(params)):
+			assert np.allclose(gfp.spectrum_sampler(wl, *params[ii]), reference[ii], rtol = 1e-4, equal_nan = True)
+
+def test_iir_convolution():
+
+	fft = wdtools.GFP(resolution = 3)
+	iir = wdtools.GFP(resolution = 3, convolution = 'iir')
+	params = np.array([[8000, 7.5], [15000, 8.0], [30000, 8.5]])
+	native = fft._nn_forward(params, 'DA')
+
+	# the recursive filter has exactly the requested width, so an impulse comes out with a standard deviation of `resolution`
+	impulse = np.zeros(len(iir.lamgrid['DA']))
+	impulse[len(impulse) // 2] = 1
+	response = iir._convolve(impulse, 'DA')
+	pix = np.arange(len(impulse)) - len(impulse) // 2
+	assert np.isclose(np.sum(response), 1, rtol = 1e-6)
+	assert np.isclose(np.sqrt(np.sum(response * pix**2)), iir.resolution['DA'], rtol = 1e-4)
+
+	# its shape approximates the truncated Gaussian to a couple of percent
+	assert np.allclose(iir._convolve(native, 'DA'), fft._convolve(native, 'DA'), rtol = 2e-2)
+
+	# restricting it to the fit window cuts the filter state at the window edges, which should only add a small error
+	wl = np.linspace(4000, 5000, 1000)
+	full = iir._resample(wl, iir._convolve(native, 'DA'), 'DA')
+	iir.specialize_for_wl(wl)
+	assert np.allclose(iir.spectrum_sampler_batch(wl, params), full, rtol = 1e-3)
+
+def test_xcorr_rv():
+
+	sp = wdtools.SpecTools()
+	wl = np.linspace(6400, 6700, 600)
+	temp_fl = 1 - 0.5 * np.exp(-0.5 * (wl - 6564.61)**2 / 5**2)
+	fl = sp.doppler_shift(wl, temp_fl, 40) + 0.01 * np.random.normal(size = len(wl))
+
+	# the vectorized shifts and correlations should match the scalar np.interp and np.corrcoef loop
+	rvgrid, cc = sp.xcorr_rv(wl, fl, wl, temp_fl, rv_range = 200, npoint = 101)
+	shifted = sp.doppler_shift(wl, temp_fl, rvgrid)
+	for ii, rv in enumerate(rvgrid):
+		assert np.allclose(shifted[ii], np.interp(wl * np.sqrt((1 - rv / 2.99792458e5) / (1 + rv / 2.99792458e5)), wl, temp_fl))
+		assert np.isclose(cc[ii], np.corrcoef(fl, shifted[ii])[1, 0])
+
+	assert abs(rvgrid[np.argmax(cc)] - 40) < 10
+
+def test_load_weights(tmp_path):
+
+	pytest.importorskip('tensorflow')
+
+	gfp = wdtools.GFP(resolution = 1)
+	assert gfp._model_DA is None # the Keras network is only built when it is accessed
+
+	extracted = gfp.extract_weights(gfp.model_DA)
+	assert gfp.model['DA'] is gfp.model_DA
+	loaded = gfp.load_weights('DA')
+
+	assert len(loaded) == len(extracted)
+	for (W1, b1), (W2, b2) in zip(loaded, extracted):
+		assert np.array_equal(W1, W2) and np.array_equal(b1, b2)
+
+	gfp.save_weights(tmp_path / 'weights.npz', 'DA')
+	for (W1, b1), (W2, b2) in zip(gfp.load_weights('DA', tmp_path / 'weights.npz'), extracted):
+		assert np.array_equal(W1, W2) and np.array_equal(b1, b2)
+
 if __name__ == '__main__':
-	test_gfp()
\ No newline at end of file
+	test_gfp()
+	test_spectrum_sampler_batch()
\ No newline at end of file
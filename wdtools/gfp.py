@@ -1,26 +1,23 @@
 import numpy as np
-import scipy
-import matplotlib.pyplot as plt
 from scipy import stats
 import glob
 import pickle
 import sys
 from scipy import interpolate
+from scipy import signal
+from scipy import ndimage
+from scipy import sparse
 import os
-import emcee
-import corner
 from scipy import optimize as opt
 from bisect import bisect_left
 import warnings
 import lmfit
-
-import tensorflow as tf
-from tensorflow.python.keras.models import *
-from tensorflow.keras.layers import *
-from tensorflow.keras.optimizers import *
+import copy
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 from numpy.polynomial.polynomial import polyfit, polyval
-from numpy.polynomial.chebyshev import chebfit, chebval
+from numpy.polynomial.chebyshev import chebfit, chebvander
 from scipy.interpolate import splev, splrep
 
 
@@ -31,8 +28,6 @@ sys.path.append(dir_path)
 from .spectrum import SpecTools
 from .corr3d import *
 
-interp1d = interpolate.interp1d
-
 halpha = 6564.61
 hbeta = 4862.68
 hgamma = 4341.68
@@ -42,9 +37,49 @@ speed_light = 299792458
 k_B = 1.38064852e-23
 
 def find_nearest(array, value):
+	'''
+	Index of the element of the sorted `array` closest to `value`, found by binary search. Ties resolve to the lower index. 
+	'''
 	array = np.asarray(array)
-	idx = (np.abs(array - value)).argmin()
-	return idx
+	if len(array) == 1:
+		return np.zeros(np.shape(value), dtype = int)[()]
+	idx = np.clip(np.searchsorted(array, value), 1, len(array) - 1)
+	return idx - ((value - array[idx - 1]) <= (array[idx] - value))
+
+def gaussian_kernel(sigma, truncate = 4.0):
+	'''
+	Normalized Gaussian kernel with standard deviation `sigma` pixels, truncated at `truncate` standard deviations. 
+	Identical to the kernel used internally by `scipy.ndimage.gaussian_filter1d`. 
+	'''
+	radius = int(truncate * sigma + 0.5)
+	x = np.arange(-radius, radius + 1)
+	kernel = np.exp(-0.5 * x**2 / sigma**2)
+	return kernel / np.sum(kernel)
+
+def young_van_vliet(sigma):
+	'''
+	Filter coefficients of the third-order recursive Gaussian approximation of Young & van Vliet (1995), for a standard deviation 
+	of `sigma` pixels. Returns the (b, a) pair for `scipy.signal.lfilter`; the filter must be applied forwards and then backwards. 
+	The published q(sigma) relation gives a response about 10% wider than `sigma`, so q is instead solved for such that the forward-backward 
+	impulse response has a variance of exactly sigma**2. 
+	'''
+	def coefficients(q):
+		b0 = 1.57825 + 2.44413 * q + 1.4281 * q**2 + 0.422205 * q**3
+		b1 = 2.44413 * q + 2.85619 * q**2 + 1.26661 * q**3
+		b2 = -(1.4281 * q**2 + 1.26661 * q**3)
+		b3 = 0.422205 * q**3
+		return np.array([1 - (b1 + b2 + b3) / b0]), np.array([1, -b1 / b0, -b2 / b0, -b3 / b0])
+
+	def variance(q):
+		# moments of the causal impulse response from the derivatives of its generating function b / A(x) at x = 1
+		b, a = coefficients(q)
+		d1 = a[1] + 2 * a[2] + 3 * a[3]
+		d2 = 2 * a[2] + 6 * a[3]
+		mean = -d1 / b[0]
+		return 2 * (2 * d1**2 / b[0]**2 - d2 / b[0] + mean - mean**2) # the backward pass doubles the variance
+
+	q = opt.brentq(lambda q: variance(q) - sigma**2, 1e-3, 2 * sigma + 10)
+	return coefficients(q)
 
 class GFP:
 
@@ -52,7 +87,7 @@ class GFP:
 
 	"""
 
-	def __init__(self, resolution = 3, specclass = 'DA'):
+	def __init__(self, resolution = 3, specclass = 'DA', convolution = 'fft'):
 
 		'''
 		Initializes class. 
@@ -63,23 +98,41 @@ class GFP:
 			Spectral resolution of the observed spectrum, in Angstroms (sigma). The synthetic spectra are convolved with this Gaussian kernel before fitting. 
 		specclass : str ['DA', 'DB']
 			Specifies whether to fit hydrogen-rich (DA) or helium-rich (DB) atmospheric models. DB atmospheric models are not publicly available at this time. 
+		convolution : str ['fft', 'iir']
+			How to convolve synthetic spectra with the instrumental resolution. 'fft' applies the exact truncated Gaussian kernel. 'iir' uses a 
+			recursive approximation to the Gaussian whose cost does not depend on the kernel width, at the price of a small approximation error. 
 		'''
 
 
+		if convolution not in ['fft', 'iir']:
+			raise ValueError("convolution must be either 'fft' or 'iir'")
+
 		self.res_ang = resolution
+		self.convolution = convolution
+		self._label_offset = np.array([5500, 6.5])
+		self._label_range = np.array([40000 - 5500, 9.5 - 6.5])
+		self._label_scale = 1 / self._label_range
 		self.resolution = {};
-		self.model = {};
 		self.lamgrid = {};
 
 		self.H_DA = 128
 		self.lamgrid_DA = np.loadtxt(dir_path + '/models/neural_gen/DA_lamgrid.txt')
-		self.model_DA = self.generator(self.H_DA, len(self.lamgrid_DA))
-		self.model_DA.load_weights(dir_path + '/models/neural_gen/DA_normNN.h5')
-		self.spec_min, self.spec_max = np.loadtxt(dir_path + '/models/neural_gen/DA_specsc.txt')
+		self._model_DA = None
+		self._nn = {}
+		if os.path.exists(dir_path + '/models/neural_gen/DA_weights.npz'): # plain arrays, so TensorFlow is never imported
+			self._nn['DA'] = self.load_weights('DA')
+		else:
+			self._nn['DA'] = self.extract_weights(self.model_DA)
+		self.spec_min, self.spec_max = np.loadtxt(dir_path + '/models/neural_gen/DA_specsc.txt', dtype = np.float32)
 		pix_per_a = len(self.lamgrid_DA) / (self.lamgrid_DA[-1] - self.lamgrid_DA[0])
 		self.resolution['DA'] = resolution * pix_per_a
-		self.model['DA'] = self.model_DA
+		self._gkernel = {}
+		self._gkernel['DA'] = gaussian_kernel(self.resolution['DA']).astype(np.float32)
+		self._iir_coef = {}
+		self._iir_coef['DA'] = young_van_vliet(self.resolution['DA'])
 		self.lamgrid['DA'] = self.lamgrid_DA
+		self._nn_head = {}
+		self._nn_head['DA'] = self._output_layer('DA', slice(None))
 		self.exclude_wl_default = np.array([3790, 3810, 3819, 3855,3863, 3920, 3930 , 4020 , 4040, 4180, 4215,
 					   4490, 4662.68, 5062.68, 6314.61, 6814.61]);
 		self.exclude_wl = self.exclude_wl_default
@@ -87,6 +140,15 @@ class GFP:
 		self.cont_fixed = False
 		self.rv_fixed = False
 		self.rv = 0
+		self._cont_basis = None
+		self._remap = None
+		self._window = None
+
+		self._synth_native = lru_cache(maxsize = 1024)(self._synth_native)
+		self._synth_convolved = lru_cache(maxsize = 256)(self._synth_convolved)
+		self._interp_maps = {}
+		self._cheb_bases = {}
+		self._last_call = None
 
 
 		self.centroid_dict = dict(alpha = 6564.61, beta = 4862.68, gamma = 4341.68, delta = 4102.89, eps = 3971.20, h8 = 3890.12)
@@ -117,6 +179,25 @@ class GFP:
 		
 		self.sp = SpecTools()
 
+	@property
+	def model_DA(self):
+		"""
+		Keras generator network for DA spectra. Spectra are generated from NumPy copies of its weights, so the network is only built, 
+		importing TensorFlow, the first time this is accessed. 
+		"""
+		if self._model_DA is None:
+			self._model_DA = self.generator(self.H_DA, len(self.lamgrid_DA))
+			self._model_DA.load_weights(dir_path + '/models/neural_gen/DA_normNN.h5')
+			self._model_DA.trainable = False
+		return self._model_DA
+
+	@property
+	def model(self):
+		"""
+		Dictionary of the Keras generator networks by spectral class, built on first access like `GFP.model_DA`. 
+		"""
+		return dict(DA = self.model_DA)
+
 
 	def label_sc(self, label_array):
 
@@ -126,17 +207,13 @@ class GFP:
 		Parameters
 		---------
 		label_array : array
-			Unscaled array with Teff in the first column and logg in the second column
+			Unscaled array with Teff in the first column and logg in the second column. Any leading dimensions are preserved. 
 		Returns
 		-------
 			array
 				Scaled array
 		"""
-		teffs = label_array[:, 0];
-		loggs = label_array[:, 1];
-		teffs = (teffs - 5500) / (40000 - 5500)
-		loggs = (loggs - 6.5) / (9.5 - 6.5)
-		return np.vstack((teffs, loggs)).T
+		return (label_array[..., :2] - self._label_offset) * self._label_scale
 
 	def inv_label_sc(self, label_array):
 		"""
@@ -145,17 +222,13 @@ class GFP:
 		Parameters
 		---------
 		label_array : array
-			Scaled array with Teff in the first column and logg in the second column
+			Scaled array with Teff in the first column and logg in the second column. Any leading dimensions are preserved. 
 		Returns
 		-------
 			array
 				Unscaled array
 		"""
-		teffs = label_array[:, 0];
-		loggs = label_array[:, 1];
-		teffs = (teffs * (40000 - 5500)) + 5500
-		loggs = (loggs * (9.5 - 6.5)) + 6.5
-		return np.vstack((teffs, loggs)).T
+		return label_array[..., :2] * self._label_range + self._label_offset
 
 	def spec_sc(self, spec):
 		return (spec - self.spec_min) / (self.spec_max - self.spec_min)
@@ -164,6 +237,10 @@ class GFP:
 		return spec * (self.spec_max - self.spec_min) + self.spec_min
 
 	def generator(self, H, n_pix):
+		from tensorflow.keras.models import Model # TensorFlow is only needed to (re)train the generator
+		from tensorflow.keras.layers import Input, Dense
+		from tensorflow.keras.optimizers import Adamax
+
 		x = Input(shape=(2,))
 		y = Dense(H,activation='relu',trainable = True)(x)
 		y = Dense(H,activation='relu',trainable = True)(y)
@@ -175,6 +252,58 @@ class GFP:
 					  metrics = ['mae'])
 		return model
 
+	def extract_weights(self, model):
+		"""
+		Extracts the weights of a generator network so that it can be evaluated with plain NumPy matrix products, 
+		avoiding the TensorFlow dispatch overhead that dominates the cost of generating a single spectrum. 
+
+		Parameters
+		---------
+		model : keras.Model
+			Generator network returned by `GFP.generator`, with weights loaded. 
+		Returns
+		-------
+			list
+				List of (weights, biases) C-contiguous float32 array pairs of the Dense layers, in order. All but the last layer use ReLU activations. 
+				The layout lets NumPy hand the matrix products in `GFP._nn_forward` straight to single-precision BLAS without copying. 
+		"""
+
+		return [tuple(np.ascontiguousarray(w, dtype = np.float32) for w in layer.get_weights()) for layer in model.layers if len(layer.get_weights()) > 0]
+
+	def save_weights(self, filename, specclass = None):
+		"""
+		Saves the generator weights of `specclass` to a NumPy archive. The package ships this archive for each generator in `models/neural_gen`, 
+		and `__init__` loads it instead of building the Keras generator, so TensorFlow does not have to be imported. 
+
+		Parameters
+		---------
+		filename : str
+			Path of the archive to write. 
+		specclass : str, optional
+			Whether to save the hydrogen-rich (DA) or helium-rich (DB) generator. If None, uses default. 
+		"""
+
+		if specclass is None:
+			specclass = self.specclass;
+
+		arrays = {}
+		for ii, (W, b) in enumerate(self._nn[specclass]):
+			arrays['W%i' % (ii + 1)] = W
+			arrays['b%i' % (ii + 1)] = b
+		np.savez(filename, **arrays)
+
+	def load_weights(self, specclass, filename = None):
+		"""
+		Loads generator weights from an archive written by `GFP.save_weights`, in the format returned by `GFP.extract_weights`. 
+		If `filename` is None, reads the archive shipped with the package for `specclass`. 
+		"""
+
+		if filename is None:
+			filename = dir_path + '/models/neural_gen/%s_weights.npz' % specclass
+
+		with np.load(filename) as arrays:
+			return [tuple(np.ascontiguousarray(arrays[name % ii], dtype = np.float32) for name in ('W%i', 'b%i')) for ii in range(1, len(arrays.files) // 2 + 1)]
+
 	def synth_spectrum_sampler(self, wl, teff, logg, rv, specclass = None):
 		"""
 		Generates synthetic spectra from labels using the neural network, translated by some radial velocity. These are _not_ interpolated onto the requested wavelength grid;
@@ -202,14 +331,170 @@ class GFP:
 		if specclass is None:
 			specclass = self.specclass;
 
-		label = self.label_sc(np.asarray(np.stack((teff,logg)).reshape(1,-1)))
-		synth = self.model[specclass].predict(label)[0]
-		synth = 10**self.inv_spec_sc(synth)
-		synth = self.sp.doppler_shift(self.lamgrid[specclass], synth, rv)
-		synth =  (np.ravel(synth).astype('float64'))
+		synth = self._nn_forward(np.array([[teff, logg]]), specclass)[0]
+		if rv != 0: # same shift as SpecTools.doppler_shift, which clamps to the edge pixels
+			idx, frac, _ = self._interp_map(self.lamgrid[specclass], specclass, rv)
+			frac = np.clip(frac, 0, 1)
+			synth = synth[idx] * (1 - frac) + synth[idx + 1] * frac
+		synth =  np.ravel(synth)
 
 		return synth
 
+	def _nn_forward(self, labels, specclass, head = None):
+		"""
+		Evaluates the generator network on an (N, 2) array of unscaled (Teff, logg) labels in a single batch, 
+		returning the (N, n_pix) un-shifted synthetic spectra on the native wavelength grid. If `head` is an output layer 
+		from `GFP._output_layer`, only the pixels of its window are computed. 
+		"""
+
+		if head is None:
+			head = self._nn_head[specclass]
+		W_out, b_out = head
+
+		h = self.label_sc(labels).astype(np.float32)
+		for W, b in self._nn[specclass][:-1]:
+			h = h @ W
+			h += b
+			np.maximum(h, 0, out = h)
+		synth = h @ W_out
+		synth += b_out
+		return np.exp(synth, out = synth)
+
+	def _output_layer(self, specclass, window):
+		"""
+		Weights and biases of the output layer of the generator network for `specclass`, restricted to the native pixels in `window`. The inverse 
+		spectrum scaling and the conversion from log10 flux are folded in, so that the flux is the plain exponential of the layer output. 
+		The arrays are contiguous so that the matrix product in `GFP._nn_forward` does not need to copy them. 
+		"""
+
+		W_out, b_out = self._nn[specclass][-1]
+		scale = np.log(10) * (self.spec_max[window] - self.spec_min[window])
+		W_out = np.ascontiguousarray(W_out[:, window] * scale, dtype = np.float32)
+		b_out = np.ascontiguousarray(b_out[window] * scale + np.log(10) * self.spec_min[window], dtype = np.float32)
+		return W_out, b_out
+
+	def specialize_for_wl(self, wl, specclass = None, fast_norm = False):
+		"""
+		Specializes the synthetic spectrum samplers to the wavelength grid `wl` at the current radial velocity. The generator network then only computes, 
+		and the samplers only convolve, the native pixels needed to model `wl`, which is usually a small fraction of the grid. With FFT convolution, the 
+		fixed shift, convolution and resampling are also folded into one sparse operator from `GFP._remap_matrix`. This is called by `GFP.fit_spectrum`, 
+		and only affects calls with the same `wl`, radial velocity and `specclass`. 
+
+		Parameters
+		----------
+		wl : array
+			Array of spectral wavelengths on which synthetic spectra will be generated
+		specclass : str, optional
+			Whether to use hydrogen-rich (DA) or helium-rich (DB) atmospheric models. If none, reverts to default. 
+		fast_norm : bool, optional
+			If True and `self.norm_kw` has niter = 0, also precomputes the fixed-knot continuum projection from `GFP._continuum_basis`. See `GFP.fit_spectrum`. 
+		"""
+
+		if self.rv_fixed:
+			rv = self.rv
+		else:
+			rv = 0
+
+		if specclass is None:
+			specclass = self.specclass;
+
+		window = self._fit_window(wl, rv, specclass)
+		self._window = (np.array(wl), rv, specclass, window, self._output_layer(specclass, window))
+
+		self._remap = None
+		if self.convolution == 'fft':
+			self._remap = (np.array(wl), rv, specclass, self._remap_matrix(wl, rv, specclass, window))
+
+		self._cont_basis = None
+		if fast_norm and self.norm_kw.get('niter', 0) == 0: # the spline weights change between iterations, so only a single pass is cached
+			cont_fixed = self.cont_fixed
+			self.cont_fixed = False
+			self._cont_basis = self._continuum_basis(wl, self.spectrum_sampler(wl, 12000, 8, specclass = specclass))
+			self.cont_fixed = cont_fixed
+
+	def _synth_native(self, teff, logg, specclass, start = 0, stop = None):
+		"""
+		Rest-frame synthetic spectrum on pixels [start:stop] of the native wavelength grid of `specclass`, straight from the generator network. 
+		If these pixels are the window set up by `GFP.specialize_for_wl`, only they are computed. Memoized per instance in `__init__`, so callers 
+		should pass labels that are already rounded. Since the Doppler shift is applied afterwards, the result is reused across radial velocities. 
+		The returned array is read-only. 
+		"""
+
+		head = None
+		if self._window is not None:
+			window_class, window, window_head = self._window[2:]
+			if window_class == specclass and (window.start, window.stop) == (start, stop):
+				head = window_head
+
+		synth = self._nn_forward(np.array([[teff, logg]]), specclass, head)[0]
+		if head is None:
+			synth = synth[start:stop]
+		synth.flags.writeable = False
+		return synth
+
+	def _synth_convolved(self, teff, logg, specclass, start = 0, stop = None):
+		"""
+		Rest-frame synthetic spectrum on pixels [start:stop] of the native wavelength grid of `specclass`, convolved to the instrument resolution. 
+		Memoized per instance in `__init__`, so callers should pass labels that are already rounded. The returned array is read-only. 
+		"""
+
+		synth = self._synth_native(teff, logg, specclass, start, stop)
+		synth = self._convolve(synth, specclass)
+		synth.flags.writeable = False
+		return synth
+
+	def _convolve(self, synth, specclass):
+		"""
+		Convolves native-grid spectra along the last axis with the instrumental Gaussian, using either the cached kernel or the recursive filter 
+		(see `convolution` in `__init__`). The kernel is applied directly to single spectra when it is short, by overlap-add FFT convolution to 
+		single spectra otherwise, and by FFT convolution to batches, whichever is fastest at the native grid size. 
+		The edges are mirrored before convolving, so the result matches `scipy.ndimage.gaussian_filter1d` with its default 'reflect' boundary. 
+		The output has the same dtype as `synth`. 
+		"""
+
+		kernel = self._gkernel[specclass]
+		if self.convolution == 'fft' and synth.ndim == 1 and len(kernel) <= 64:
+			return ndimage.convolve1d(synth, kernel, mode = 'reflect')
+
+		radius = len(kernel) // 2
+		n_pix = synth.shape[-1]
+		synth = np.pad(synth, [(0, 0)] * (synth.ndim - 1) + [(radius, radius)], mode = 'symmetric')
+
+		if self.convolution == 'iir': # the recursion runs in double precision, since its poles lie close to the unit circle for wide kernels
+			dtype = synth.dtype
+			b, a = self._iir_coef[specclass]
+			zi = signal.lfilter_zi(b, a)
+			synth, _ = signal.lfilter(b, a, synth, zi = zi * synth[..., :1])
+			synth, _ = signal.lfilter(b, a, synth[..., ::-1], zi = zi * synth[..., -1:])
+			return synth[..., ::-1][..., radius:radius + n_pix].astype(dtype)
+
+		if synth.ndim == 1:
+			return signal.oaconvolve(synth, kernel, mode = 'valid')
+		kernel = kernel.reshape((1,) * (synth.ndim - 1) + (-1,))
+		return signal.fftconvolve(synth, kernel, mode = 'valid', axes = -1)
+
+	def _interp_map(self, wl, specclass, rv = 0):
+		"""
+		Indices and weights that linearly interpolate a rest-frame native-grid spectrum of `specclass` onto `wl` after Doppler-shifting it by `rv` km/s, 
+		along with a mask of wavelengths outside the native grid. Shifting the spectrum is equivalent to sampling it at the blueshifted wavelengths, 
+		so no separate shift is needed. The most recent map per class is cached, since `wl` and `rv` are fixed for the duration of a fit. 
+		"""
+
+		cached = self._interp_maps.get(specclass)
+		if cached is not None and cached[1] == rv and np.array_equal(cached[0], wl):
+			return cached[2:]
+
+		c = speed_light * 1e-3
+		rest_wl = wl * np.sqrt((1 - rv / c) / (1 + rv / c))
+
+		lamgrid = self.lamgrid[specclass]
+		idx = np.clip(np.searchsorted(lamgrid, rest_wl) - 1, 0, len(lamgrid) - 2)
+		frac = ((rest_wl - lamgrid[idx]) / (lamgrid[idx + 1] - lamgrid[idx])).astype(np.float32)
+		outside = (rest_wl < lamgrid[0]) | (rest_wl > lamgrid[-1])
+
+		self._interp_maps[specclass] = (np.array(wl), rv, idx, frac, outside)
+		return idx, frac, outside
+
 	def spectrum_sampler(self, wl, teff, logg, *polyargs, specclass = None):
 		"""
 		Wrapper function that talks to the generative neural network in scaled units, and also performs the Gaussian convolution to instrument resolution. 
@@ -240,23 +525,216 @@ class GFP:
 
 		if specclass is None:
 			specclass = self.specclass;
-		synth = self.synth_spectrum_sampler(self.lamgrid[specclass], teff, logg, rv, specclass)
-		synth = scipy.ndimage.gaussian_filter1d(synth, self.resolution[specclass])
-		func = interp1d(self.lamgrid[specclass], synth, fill_value = np.nan, bounds_error = False)
-		synth =  func(wl)
 
-		if self.cont_fixed:
+		teff, logg = float(np.squeeze(teff)), float(np.squeeze(logg)) # 0-d or single-element arrays become hashable scalars for the caches
 
-			dummy_ivar = 1 / np.repeat(0.001, len(wl))**2
-			nanwhere = np.isnan(synth)
-			dummy_ivar[nanwhere] = 0
-			synth[nanwhere] = 0
-			synth,_ = self.spline_norm_DA(wl, synth, dummy_ivar, kwargs = self.norm_kw) # Use default KW from function
-			synth[nanwhere] = np.nan
+		# the optimizers usually finish by re-evaluating the best parameters, which are then requested again for the final model
+		key = (teff, logg, polyargs, specclass, rv, self.cont_fixed)
+		last = self._last_call
+		if last is not None and last[0] == key and last[1] is self._cont_basis and np.array_equal(last[2], wl):
+			return last[3].copy()
+
+		window, _ = self._get_window(wl, rv, specclass)
+		remap = self._get_remap(wl, rv, specclass)
+		if remap is not None:
+			synth = self._apply_remap(self._synth_native(round(teff, 2), round(logg, 5), specclass, window.start, window.stop), remap)
+		else:
+			synth = self._synth_convolved(round(teff, 2), round(logg, 5), specclass, window.start, window.stop)
+			synth = self._resample(wl, synth, specclass, rv, window.start)
+
+		if self.cont_fixed:
+			synth = self._normalize_model(wl, synth)
 
 		if len(polyargs) > 0:
-			synth = synth * chebval(2 * (wl - wl.min()) / (wl.max() - wl.min()) - 1, polyargs)
+			synth = synth * (self._cheb_basis(wl, len(polyargs)) @ np.asarray(polyargs))
+
+		self._last_call = (key, self._cont_basis, np.array(wl), synth.copy())
+		return synth
+
+	def spectrum_sampler_batch(self, wl, params, specclass = None):
+		"""
+		Batched version of `GFP.spectrum_sampler`, which evaluates the generative neural network once for many sets of parameters. 
+		
+		Parameters
+		----------
+		wl : array
+			Array of spectral wavelengths on which to generate the synthetic spectra
+		params : array
+			(N, 2 + n_poly) array whose rows are (teff, logg, *polyargs), with the same meaning as the arguments of `GFP.spectrum_sampler`. 
+		specclass : str, optional
+			Whether to use hydrogen-rich (DA) or helium-rich (DB) atmospheric models. If none, reverts to default. 
+		Returns
+		-------
+			array
+				(N, len(wl)) array of synthetic spectra, interpolated onto the supplied wavelength grid and convolved with the instrument resolution. 
+		"""
+
+		if self.rv_fixed:
+			rv = self.rv
+		else:
+			rv = 0
+
+		if specclass is None:
+			specclass = self.specclass;
+
+		params = np.atleast_2d(params)
+		window, head = self._get_window(wl, rv, specclass)
+		synth = self._nn_forward(params[:, :2], specclass, head)
+
+		remap = self._get_remap(wl, rv, specclass)
+		if remap is not None:
+			synth = self._apply_remap(synth, remap)
+		else:
+			synth = self._convolve(synth, specclass)
+			synth = self._resample(wl, synth, specclass, rv, window.start)
+
+		if self.cont_fixed:
+			synth = self._normalize_model(wl, synth)
+
+		if params.shape[1] > 2:
+			synth = synth * (params[:, 2:] @ self._cheb_basis(wl, params.shape[1] - 2).T)
+
+		return synth
+
+	def _fit_window(self, wl, rv, specclass):
+		"""
+		Slice of the native wavelength grid of `specclass` that is needed to model `wl` at a radial velocity of `rv` km/s. It spans the pixels that 
+		`GFP._resample` interpolates between, padded by the half-width of the instrumental kernel. With the truncated kernel of the FFT convolution, 
+		convolving only this slice gives the same result as convolving the whole grid. The recursive IIR filter instead starts and ends at the window 
+		edges, which changes the model by a few parts in 1e4, well below the ~2% shape error of the recursive approximation itself. 
+		"""
+
+		radius = len(self._gkernel[specclass]) // 2
+		idx, frac, outside = self._interp_map(wl, specclass, rv)
+		return slice(max(idx.min() - radius, 0), min(idx.max() + 2 + radius, len(self.lamgrid[specclass])))
+
+	def _get_window(self, wl, rv, specclass):
+		"""
+		Returns the slice from `GFP._fit_window` and the matching output layer from `GFP._output_layer` if `GFP.specialize_for_wl` has precomputed them 
+		for these arguments, otherwise a slice of the whole native grid and None. 
+		"""
+
+		if self._window is not None:
+			window_wl, window_rv, window_class, window, head = self._window
+			if window_rv == rv and window_class == specclass and np.array_equal(window_wl, wl):
+				return window, head
+		return slice(0, len(self.lamgrid[specclass])), None
+
+	def _remap_matrix(self, wl, rv, specclass, window):
+		"""
+		Sparse (len(wl), n_window) operator that convolves a rest-frame spectrum on the `window` slice of the native grid of `specclass` with the truncated 
+		instrumental Gaussian, and linearly interpolates it onto `wl` Doppler-shifted by `rv` km/s. It reproduces the FFT path of `GFP._convolve` (including 
+		the mirrored edges) followed by `GFP._resample` in a single matrix product. Also returns the mask of `wl` outside the native grid. 
+		"""
+
+		n_pix = len(self.lamgrid[specclass])
+		kernel = self._gkernel[specclass]
+		radius = len(kernel) // 2
+
+		# each output pixel interpolates between two convolved pixels, each of which is a kernel-weighted sum of native pixels
+		idx, frac, outside = self._interp_map(wl, specclass, rv)
+		cols = np.stack((idx, idx + 1), axis = 1)[:, :, None] + np.arange(-radius, radius + 1)
+		cols = np.where(cols < 0, -cols - 1, cols)
+		cols = np.where(cols >= n_pix, 2 * n_pix - 1 - cols, cols)
+		weights = np.stack((1 - frac, frac), axis = 1)[:, :, None] * kernel
+		rows = np.repeat(np.arange(len(wl)), 2 * len(kernel))
+		remap = sparse.csr_matrix((weights.ravel(), (rows, cols.ravel() - window.start)), shape = (len(wl), window.stop - window.start), dtype = np.float32)
+		return remap, outside
+
+	def _get_remap(self, wl, rv, specclass):
+		"""
+		Returns the operator from `GFP._remap_matrix` if `fit_spectrum` has precomputed one for these arguments, otherwise None. 
+		"""
 
+		if self._remap is None:
+			return None
+		remap_wl, remap_rv, remap_class, remap = self._remap
+		if remap_rv == rv and remap_class == specclass and np.array_equal(remap_wl, wl):
+			return remap
+		return None
+
+	def _apply_remap(self, synth, remap):
+		"""
+		Applies an operator from `GFP._remap_matrix` to native-grid spectra along the last axis. 
+		"""
+
+		matrix, outside = remap
+		synth = (matrix @ synth.T).T
+		synth[..., outside] = np.nan
+		return synth
+
+	def _resample(self, wl, synth, specclass, rv = 0, start = 0):
+		"""
+		Doppler-shifts rest-frame native-grid spectra by `rv` km/s and linearly interpolates them onto `wl` along the last axis, with NaN outside the native grid. 
+		`start` is the first native pixel held in `synth`, if it only covers a slice of the grid. 
+		"""
+
+		idx, frac, outside = self._interp_map(wl, specclass, rv)
+		idx = idx - start
+		synth = synth[..., idx] * (1 - frac) + synth[..., idx + 1] * frac
+		synth[..., outside] = np.nan
+		return synth
+
+	def _cheb_basis(self, wl, ncoef):
+		"""
+		(len(wl), ncoef) Chebyshev Vandermonde matrix on `wl` mapped to [-1, 1], so that multiplying it by the polynomial coefficients 
+		evaluates the multiplicative continuum polynomial. The most recent matrix per number of coefficients is cached. 
+		"""
+
+		cached = self._cheb_bases.get(ncoef)
+		if cached is not None and np.array_equal(cached[0], wl):
+			return cached[1]
+
+		basis = chebvander(2 * (wl - wl.min()) / (wl.max() - wl.min()) - 1, ncoef - 1)
+		self._cheb_bases[ncoef] = (np.array(wl), basis)
+		return basis
+
+	def _continuum_basis(self, wl, ref):
+		"""
+		Precomputes a fixed-knot least-squares version of the model continuum normalization in `GFP._normalize_model`. The knots are those of the 
+		smoothing spline that `SpecTools.spline_norm` fits to the reference model `ref` on `wl`. Since the knots are then fixed, normalizing any other model 
+		is a linear projection. Returns the continuum pixel indices, the B-spline design matrix on `wl`, and the pseudo-inverse of its continuum rows. 
+		"""
+
+		k = self.norm_kw.get('k', 3)
+		sfac = self.norm_kw.get('sfac', 1)
+
+		x = (wl - np.min(wl)) / (np.max(wl) - np.min(wl))
+		nanwhere = np.isnan(ref)
+		cont_mask = np.ones(len(wl), dtype = bool)
+		for c1, c2 in np.searchsorted(wl, self.exclude_wl[:len(self.exclude_wl) // 2 * 2]).reshape(-1, 2):
+			cont_mask[c1:c2] = False
+
+		# same smoothing spline as SpecTools.spline_norm, with the dummy weights of GFP._normalize_model
+		y = np.where(nanwhere, 0, ref)
+		w = np.where(nanwhere, 0, 1e3)
+		s = (len(x) - np.sqrt(2 * len(x))) * sfac
+		t = splrep(x[cont_mask], y[cont_mask], k = k, s = s, w = w[cont_mask])[0]
+
+		design = interpolate.BSpline(t, np.eye(len(t) - k - 1), k)(x)
+		cont_idx = np.flatnonzero(cont_mask & ~nanwhere)
+		return cont_idx, design.astype(np.float32), np.linalg.pinv(design[cont_idx]).astype(np.float32)
+
+	def _normalize_model(self, wl, synth):
+		"""
+		Continuum-normalizes synthetic spectra on `wl` along the last axis in the same way as the observed spectrum, using `self.norm_kw`. 
+		During a fit with `fast_norm` this uses the fixed-knot projection from `GFP._continuum_basis`, which normalizes a whole batch with two matrix 
+		products. Otherwise a smoothing spline is fitted to each spectrum. 
+		"""
+
+		if self._cont_basis is not None:
+			cont_idx, design, pinv = self._cont_basis
+			return synth / ((np.take(synth, cont_idx, axis = -1) @ pinv.T) @ design.T)
+
+		if synth.ndim > 1:
+			return np.array([self._normalize_model(wl, row) for row in synth])
+
+		dummy_ivar = 1 / np.repeat(0.001, len(wl))**2
+		nanwhere = np.isnan(synth)
+		dummy_ivar[nanwhere] = 0
+		synth[nanwhere] = 0
+		synth,_ = self.spline_norm_DA(wl, synth, dummy_ivar, kwargs = self.norm_kw) # Use default KW from function
+		synth[nanwhere] = np.nan
 		return synth
 
 
@@ -318,7 +796,7 @@ class GFP:
 						verbose = True,
 						lines = ['alpha', 'beta', 'gamma', 'delta', 'eps', 'h8'], lmfit_kw = dict(method = 'leastsq', epsfcn = 0.1), 
 						rv_kw = dict(plot = False, distance = 100, nmodel = 2, edge = 15),
-						nteff = 3,  rv_line = 'alpha', corr_3d = False):
+						nteff = 3,  rv_line = 'alpha', corr_3d = False, init = 'restarts', de_kw = dict(popsize = 20, tol = 1e-3), ngrid = 20, moves = None, fast_norm = False):
 
 		"""
 		Main fitting routine, takes a continuum-normalized spectrum and fits it with MCMC to recover steller labels. 
@@ -344,6 +822,10 @@ class GFP:
 			Order of additive Chebyshev polynomial during the fitting process. Can usually leave this to zero unless the normalization is really bad. 
 		norm_kw : dict, optional
 			Dictionary of keyword arguments that are passed to the spline normalization routine. 
+		fast_norm : bool, optional
+			If True and `norm_kw` has niter = 0, the synthetic spectra are normalized with a fixed-knot least-squares projection instead of a smoothing spline 
+			per model. The knots are those of the spline fitted to a 12000 K, logg = 8 model, so this is an approximation: it is much faster for batched 
+			evaluations, but can shift the fitted labels by ~0.01 dex in logg and tens of K in Teff, and changes the reduced chi-square. 
 		nwalkers : int, optional
 			Number of independent MCMC 'walkers' that will explore the parameter space
 		burn : int, optional
@@ -352,7 +834,8 @@ class GFP:
 		ndraws : int, optional
 			Number of 'production' steps after the burn-in. The final number of posterior samples will be nwalkers * ndraws.
 		threads : int, optional
-			Number of threads for distributed sampling. 
+			Number of threads used to run the `nteff` initializations of the minimization routine concurrently. The MCMC likelihood is evaluated for all walkers
+			in a single batched call of the neural network. 
 		progress : bool, optional
 			Whether to show a progress bar during the MCMC sampling. 
 		plot_init : bool, optional
@@ -382,10 +865,21 @@ class GFP:
 			Dictionary of keyword arguments to the RV fitting routine
 		nteff : int, optional
 			Number of equidistant temperatures to try as initialization points for the minimization routine. 
+		init : str ['restarts', 'de', 'grid'], optional
+			How to initialize the minimization routine. 'restarts' starts it from `nteff` equidistant temperatures and keeps the best fit. 'de' first runs a global 
+			differential evolution search over all parameters (in log temperature), evaluating each generation in a single batched call of the neural network, and polishes the result once. 
+			'grid' evaluates a coarse grid of log-spaced temperatures and surface gravities in a single batched call, and polishes the best grid point once. 
+		de_kw : dict, optional
+			Dictionary of keyword arguments to `scipy.optimize.differential_evolution`, used when `init` is 'de'. 
+		ngrid : int, optional
+			Number of equidistant temperatures and surface gravities in the coarse grid, used when `init` is 'grid'. 
 		rv_line : str, optional
 			Which Balmer line to use for the radial velocity fit. We recommend 'alpha'. 
 		corr_3d : bool, optional
 			If True, applies 3D corrections from Tremblay et al. (2013) to stellar parameters before returning them. 
+		moves : emcee move or list, optional
+			Proposal moves for the `emcee` sampler, in the format of its `moves` argument. If None, uses a mixture of differential evolution moves 
+			(80% `DEMove`, 20% `DESnookerMove`), which accept more often than the default stretch move along the narrow correlated Teff-logg posterior. 
 
 		Returns
 		-------
@@ -395,8 +889,15 @@ class GFP:
 				polyorder > 0, the label array will have temperature, surface gravity, the Chebyshev coefficients, and then RV. 
 		"""
 
+		if init not in ['restarts', 'de', 'grid']:
+			raise ValueError("init must be one of 'restarts', 'de' or 'grid'")
+
 		self.cont_fixed = False
 		self.rv_fixed = False
+		self._cont_basis = None
+		self._remap = None
+		self._window = None
+		self._last_call = None
 
 		nans = np.isnan(fl)
 
@@ -419,36 +920,37 @@ class GFP:
 
 		nstarparams = 2
 
-		def lnlike(prms):
+		def chisq_batch(prms): # vectorized over parameter sets, prms has shape (N, ndim)
+
+			model = self.spectrum_sampler_batch(wl, prms)
 
-			model = self.spectrum_sampler(wl, *prms)
+			diff = np.take(model, mask_idx, axis = 1).astype(np.float64) # the chi-square is accumulated in double precision, whatever the dtype of fl
+			diff -= fl_m
+			chisq = np.einsum('ij,ij,j->i', diff, diff, ivar_m)
 
-			diff = (model - fl)**2 * ivar
-			diff = diff[self.mask]
-			chisq = np.sum(diff)
+			chisq[np.isnan(chisq)] = np.inf
+			return chisq
 
-			if np.isnan(chisq):
-				return -np.Inf
-			lnlike = -0.5 * chisq
-			#print(chisq / (np.sum(self.mask) - len(prms)))
-			return lnlike
+		def lnlike(prms):
+			return -0.5 * chisq_batch(prms)
 
 		def lnprior(prms):
-			for jj in range(nstarparams):
-				if prms[jj] < prior_lows[jj] or prms[jj] > prior_highs[jj]:
-					return -np.Inf
+			lp = np.zeros(len(prms))
+			outside = (prms[:, :nstarparams] < prior_lows) | (prms[:, :nstarparams] > prior_highs)
+			lp[np.any(outside, axis = 1)] = -np.inf
 
 			if prior_teff is not None:
 				mu,sigma = prior_teff
-				return np.log(1.0/(np.sqrt(2*np.pi)*sigma))-0.5*(prms[0]-mu)**2/sigma**2
-			else:
-				return 0
+				lp += np.log(1.0/(np.sqrt(2*np.pi)*sigma))-0.5*(prms[:, 0]-mu)**2/sigma**2
+			return lp
 
 		def lnprob(prms):
+			# the likelihood is evaluated for every walker so the batch size stays fixed, then discarded outside the prior
 			lp = lnprior(prms)
-			if not np.isfinite(lp):
-				return -np.Inf
-			return lp + lnlike(prms)
+			with np.errstate(all = 'ignore'):
+				lnp = lp + lnlike(prms)
+			lnp[~np.isfinite(lp)] = -np.inf
+			return lnp
 
 
 		param_names = [r'$T_{eff}$', r'$\log{g}$']
@@ -477,25 +979,23 @@ class GFP:
 		self.cont_fixed = True
 		self.norm_kw['plot'] = False # Set to True to see how the models are normalized
 
-		edges = [];
-		mask = np.zeros(len(wl))
-
-		for line in lines:
-			wl1 = self.centroid_dict[line] - self.distance_dict[line]
-			wl2 = self.centroid_dict[line] + self.distance_dict[line]
-			c1 = bisect_left(wl, wl1)
-			c2 = bisect_left(wl, wl2)
-
-			edges.extend([wl2, wl1])
+		centroids = np.array([self.centroid_dict[line] for line in lines])
+		distances = np.array([self.distance_dict[line] for line in lines])
+		edges = np.stack((centroids - distances, centroids + distances), axis = 1) # (n_lines, 2) array of line windows
 
-			mask[c1:c2] = 1
-
-		self.mask = mask.astype(bool)
-		edges = np.flip(edges)
-		self.edges = edges
+		self.mask = np.any((wl[:, None] >= edges[:, 0]) & (wl[:, None] < edges[:, 1]), axis = 1)
+		self.edges = edges[::-1].ravel()
+		breakpoints = np.searchsorted(wl, self.edges) # (start, end) index pairs of each line window, wl is fixed from here on
 		if fullspec:
 			self.mask = np.ones(len(fl)).astype(bool)
 
+		# the model is NaN only outside the native grid at the fixed RV, so pixels that can never contribute are dropped once here
+		valid = ~np.isnan(fl) & ~np.isnan(ivar) & ~self._interp_map(wl, self.specclass, self.rv)[2]
+		mask_idx = np.flatnonzero(self.mask & valid) # fixed for the rest of the fit
+		fl_m = np.take(fl, mask_idx)
+		ivar_m = np.take(ivar, mask_idx)
+		sqrt_ivar_m = np.sqrt(ivar_m)
+
 		tscale = 10000
 		lscale = 8
 
@@ -514,18 +1014,22 @@ class GFP:
 			params[0] = params[0] * tscale
 			params[1] = params[1] * lscale
 			model = self.spectrum_sampler(wl, *params)
-			resid = fl - model
-			chi = resid * np.sqrt(ivar)
+			chi = np.take(model, mask_idx).astype(np.float64) # lmfit sees a double-precision residual, whatever the dtype of fl
+			np.subtract(fl_m, chi, out = chi)
+			chi *= sqrt_ivar_m
 
 			#print(np.sum(chi**2) / (np.sum(self.mask) - len(params)))
 
-			return chi[self.mask]
+			return chi
 
 		star_rv = self.rv
 		if verbose:
 			print('Radial Velocity = %i ± %i km/s' % (self.rv, e_rv))
 		self.rv_fixed = True
 
+		# only the native pixels around the observed wavelengths are generated and convolved for the rest of the fit
+		self.specialize_for_wl(wl, fast_norm = fast_norm)
+
 		if verbose:
 			print('final optimization...')
 
@@ -534,11 +1038,50 @@ class GFP:
 
 		chimin = 1e50
 
-		for teff in teffgrid:
+		def restart(teff):
 			if verbose:
 				print('initializing at teff = %i K' % teff)
-			params['teff'].set(value = teff / tscale)
-			res_i = lmfit.minimize(residual, params, **lmfit_kw)
+			params_i = copy.deepcopy(params)
+			params_i['teff'].set(value = teff / tscale)
+			return lmfit.minimize(residual, params_i, **lmfit_kw)
+
+		if init == 'de':
+			if verbose:
+				print('running differential evolution...')
+			# the search runs over log10(teff), since the lines change much faster with temperature in cool stars
+			bounds = [(np.log10(6500), np.log10(40000)), (6.5, 9.5)] + [(-1, 1)] * polyorder
+			def chisq_log(prms):
+				prms = np.array(prms, dtype = np.float64)
+				prms[:, 0] = 10**prms[:, 0]
+				return chisq_batch(prms)
+			# the map-like `workers` receives a whole generation at once, which is evaluated as one batch. Any of these can be overridden in de_kw
+			de_defaults = dict(workers = lambda func, population: chisq_log(list(population)), updating = 'deferred', polish = False)
+			de = opt.differential_evolution(lambda prms: chisq_log(prms[None])[0], bounds, **{**de_defaults, **de_kw})
+			params['teff'].set(value = 10**de.x[0] / tscale)
+			params['logg'].set(value = de.x[1] / lscale)
+			for ii in range(polyorder):
+				params['c_' + str(ii)].set(value = de.x[2 + ii])
+			restarts = [lmfit.minimize(residual, params, **lmfit_kw)]
+		elif init == 'grid':
+			if verbose:
+				print('evaluating coarse grid...')
+			teffs, loggs = np.meshgrid(np.geomspace(6500, 40000, ngrid), np.linspace(6.5, 9.5, ngrid), indexing = 'ij')
+			grid = np.zeros((ngrid**2, 2 + polyorder))
+			grid[:, 0] = teffs.ravel()
+			grid[:, 1] = loggs.ravel()
+			if polyorder > 0: # the polynomial starts flat, as for the restarts
+				grid[:, 2] = 1
+			best = grid[np.argmin(chisq_batch(grid))]
+			params['teff'].set(value = best[0] / tscale)
+			params['logg'].set(value = best[1] / lscale)
+			restarts = [lmfit.minimize(residual, params, **lmfit_kw)]
+		elif threads > 1: # restarts share the memoized synthetic spectra, and the network and FFTs release the GIL
+			with ThreadPoolExecutor(max_workers = threads) as executor:
+				restarts = list(executor.map(restart, teffgrid))
+		else:
+			restarts = list(map(restart, teffgrid))
+
+		for res_i in restarts:
 			chi = np.sum(res_i.residual**2)
 			if chi < chimin:
 				res = res_i
@@ -549,7 +1092,7 @@ class GFP:
 		logg = res.params['logg'].value * lscale
 		if polyorder > 0:
 			cheb_coef = np.array(res.params)[2:]
-		redchi = np.sum(res.residual**2) / (np.sum(self.mask) - (2 + polyorder))
+		redchi = np.sum(res.residual**2) / (len(mask_idx) - (2 + polyorder))
 
 		have_stderr = False
 
@@ -576,10 +1119,16 @@ class GFP:
 			stds.extend(e_coefs)
 
 		if mcmc:
+			import emcee # plotting and sampling dependencies are imported only when needed
 
 			ndim = len(mle)
+
+			if moves is None:
+				moves = [(emcee.moves.DEMove(), 0.8), (emcee.moves.DESnookerMove(), 0.2)]
 			
-			sampler = emcee.EnsembleSampler(nwalkers,ndim,lnprob, threads = threads)
+			# with vectorize = True emcee calls lnprob directly on each batch of walkers and never uses a pool, so the parallelism is left to the 
+			# multithreaded BLAS behind the network's matrix products
+			sampler = emcee.EnsembleSampler(nwalkers,ndim,lnprob, moves = moves, vectorize = True)
 
 			pos0 = np.zeros((nwalkers,ndim))
 
@@ -588,10 +1137,10 @@ class GFP:
 			else:
 				sigmas = np.abs(1e-2 * np.array(mle)) # USE 1% ERROR
 
-			init = mle
+			center = mle
 
 			for jj in range(ndim):
-					pos0[:,jj] = (init[jj] + sigmas[jj]*np.random.normal(size = nwalkers))
+					pos0[:,jj] = (center[jj] + sigmas[jj]*np.random.normal(size = nwalkers))
 
 			if verbose:
 				print('burning in chains...')
@@ -605,6 +1154,7 @@ class GFP:
 			b = sampler.run_mcmc(b.coords, ndraws, progress = progress)
 
 			if plot_trace:
+				import matplotlib.pyplot as plt
 				f, axs = plt.subplots(ndim, 1, figsize = (10, 6))
 				for jj in range(ndim):
 					axs[jj].plot(sampler.chain[:,:,jj].T, alpha = 0.3, color = 'k');
@@ -615,7 +1165,7 @@ class GFP:
 			lnprobs = sampler.get_log_prob(flat = True)
 			medians = np.median(sampler.flatchain, 0)
 			mle = sampler.flatchain[np.argmax(lnprobs)]
-			redchi = -2 * np.max(lnprobs) / (len(wl) - ndim)
+			redchi = -2 * np.max(lnprobs) / (len(mask_idx) - ndim)
 			stds = np.std(sampler.flatchain, 0)
 			self.flatchain = sampler.flatchain
 
@@ -626,6 +1176,8 @@ class GFP:
 				print('logg is near bound of the model grid! exercise caution with this result')
 
 			if plot_corner:
+				import matplotlib.pyplot as plt
+				import corner
 				f = corner.corner(sampler.flatchain[:, :nstarparams], labels = param_names[:nstarparams],
 						 label_kwargs = dict(fontsize =  12), quantiles = (0.16, 0.5, 0.84),
 						 show_titles = True, title_kwargs = dict(fontsize = 12))
@@ -637,6 +1189,7 @@ class GFP:
 				plt.show()
 
 			if plot_corner_full:
+				import corner
 
 				f = corner.corner(sampler.flatchain, labels = param_names, 
 						 label_kwargs = dict(fontsize =  12), quantiles = (0.16, 0.5, 0.84),
@@ -656,6 +1209,7 @@ class GFP:
 			mle[1] = corr[1]
 
 		if make_plot:
+			import matplotlib.pyplot as plt
 			#fig,ax = plt.subplots(ndim, ndim, figsize = (15,15))
 
 			if fullspec:
@@ -679,12 +1233,6 @@ class GFP:
 
 			else:
 				plt.figure(figsize = (10, 10))
-				breakpoints = [];
-				for kk in range(len(self.edges)):
-					if (kk + 1)%2 == 0:
-						continue
-					breakpoints.append(bisect_left(wl, self.edges[kk]))
-					breakpoints.append(bisect_left(wl, self.edges[kk+1]))
 				# print(breakpoints)
 				for kk in range(len(breakpoints)):
 					if (kk + 1)%2 == 0:
@@ -716,6 +1264,10 @@ class GFP:
 
 		self.exclude_wl = self.exclude_wl_default
 		self.cont_fixed = False
+		self._cont_basis = None
+		self._remap = None
+		self._window = None
+		self._last_call = None
 		self.rv = 0 # RESET THESE PARAMETERS
 
 		mle = mle
@@ -727,6 +1279,7 @@ class GFP:
 		return mle, stds, redchi
 	
 if __name__ == '__main__':
+	import matplotlib.pyplot as plt
 	
 	gfp = GFP(resolution = 3)
 	wl = np.linspace(4000, 8000, 4000)
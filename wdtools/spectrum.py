@@ -265,8 +265,15 @@ class SpecTools():
             return wl_normalized, fl_normalized
 
     def find_nearest(self,array, value):
+
+        '''
+        Element of the sorted `array` closest to `value`, found by binary search. If `value` is an array, 
+        returns the nearest element for each of its entries. Ties resolve to the smaller element. 
+        '''
+
         array = np.asarray(array)
-        idx = (np.abs(array - value)).argmin()
+        idx = np.clip(np.searchsorted(array, value), 1, len(array) - 1)
+        idx = idx - ((value - array[idx - 1]) <= (array[idx] - value))
         return array[idx]
 
 
@@ -434,22 +441,36 @@ class SpecTools():
         return mean_centre, final_centre, sigma_final_centre, sigma_propagated, sigma_sample
 
     def doppler_shift(self, wl, fl, dv):
+
+        '''
+        Doppler-shifts a spectrum by `dv` km/s, keeping it on the same wavelength grid. If `dv` is an array of 
+        velocities, returns a 2D array with one shifted spectrum per row. 
+        '''
+
         c = 2.99792458e5
         df = np.sqrt((1 - dv/c)/(1 + dv/c)) 
-        new_wl = wl * df
-        new_fl = np.interp(new_wl, wl, fl)
-        return new_fl
+
+        if np.ndim(dv) == 0:
+            new_wl = wl * df
+            new_fl = np.interp(new_wl, wl, fl)
+            return new_fl
+
+        # same linear interpolation and edge clamping as np.interp, for all velocities at once
+        new_wl = wl * np.reshape(df, (-1, 1))
+        idx = np.clip(np.searchsorted(wl, new_wl, side = 'right') - 1, 0, len(wl) - 2)
+        frac = np.clip((new_wl - wl[idx]) / (wl[idx + 1] - wl[idx]), 0, 1)
+        return fl[idx] * (1 - frac) + fl[idx + 1] * frac
 
     def xcorr_rv(self, wl, fl, temp_wl, temp_fl, init_rv = 0, rv_range = 500, npoint = None):
         if npoint is None:
             npoint = int(2 * rv_range)
         rvgrid = np.linspace(init_rv - rv_range, init_rv + rv_range, npoint)
-        cc = np.zeros(npoint)
-        for ii,rv in enumerate(rvgrid):
-            shift_model = self.doppler_shift(temp_wl, temp_fl, rv)
-            corr = np.corrcoef(fl, shift_model)[1, 0]
-            #corr = -np.sum((fl - shift_model)**2) # MINIMIZE LSQ DIFF. MAYBE PROPAGATE IVAR HERE?
-            cc[ii] = corr
+        shift_models = self.doppler_shift(temp_wl, temp_fl, rvgrid)
+
+        # Pearson correlation of fl with every shifted template in a single matrix-vector product
+        shift_models = shift_models - np.mean(shift_models, axis = 1, keepdims = True)
+        fl = fl - np.mean(fl)
+        cc = (shift_models @ fl) / np.sqrt(np.sum(shift_models**2, axis = 1) * (fl @ fl))
         return rvgrid, cc
 
     def quad_max(self, rv, cc):